@@ -10,6 +10,49 @@ class Settings(BaseSettings):
     CHROMA_PERSIST_PATH: str = "chromadb_store"
     COLLECTION_NAME: str = "medical_knowledge"
     
+    # Sharded retrieval (empty = single collection above). Specs: "http://host:port",
+    # "persist_path" or "persist_path@collection" — see app/services/shards.py
+    SHARDS: List[str] = []
+    SHARD_TIMEOUT: float = 5.0  # seconds per remote shard request
+    SHARD_SLOW_MS: float = 250.0  # log shard queries slower than this
+    
+    # Adaptive reranking (distances are ChromaDB's default squared L2)
+    ADAPTIVE_RERANK: bool = True
+    RERANK_SKIP_GAP: float = 0.15  # top-1 leads top-2 by this much → skip the cross-encoder
+    RERANK_BAND_MARGIN: float = 0.1  # only candidates this close to the top-K boundary are reranked
+    RERANK_BATCH_SIZE: int = 4
+    RERANK_PATIENCE: int = 2  # stop once the top-K is unchanged for this many batches
+    
+    # Near-duplicate collapse: over-fetch, keep the closest chunk per cluster_id
+    DEDUP_CANDIDATES: bool = True
+    DEDUP_OVERFETCH: int = 3  # fetch this many times N candidates before collapsing
+    
+    # Extractive compression of ranked context before the doctor LLM
+    CONTEXT_COMPRESSION: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 300  # estimated tokens of context sent to LLM2
+    
+    # Precomputed retrieval contexts (built by scripts/build_context_cache.py)
+    CONTEXT_CACHE_ENABLED: bool = True
+    CONTEXT_CACHE_PATH: str = "Data/context_cache.json.gz"
+    CHUNKS_PATH: str = "Data/chunks.csv"  # fingerprinted so a rebuilt chunk table invalidates the cache
+    
+    # Admission control for /api/chat
+    ADMISSION_MAX_PENDING: int = 64  # requests running or waiting; beyond this → 503
+    ADMISSION_DEGRADE_AT: int = 32  # above this many pending, skip reformulation + reranking (0 = never)
+    ADMISSION_STAGE_TIMEOUT: float = 10.0  # seconds to wait for a stage slot before shedding
+    ADMISSION_RETRY_AFTER: int = 2  # Retry-After seconds sent with 503
+    INFERENCE_CONCURRENCY: int = 2  # concurrent embedder/reranker calls
+    LLM_CONCURRENCY: int = 16  # concurrent OpenAI calls
+    SESSION_RATE_PER_MINUTE: float = 20  # per session_id (0 = unlimited)
+    SESSION_BURST: int = 5
+    
+    # Batch chat (offline triage / evaluation)
+    BATCH_SIZE: int = 32  # conversations per retrieval + rerank batch
+    BATCH_LLM_CONCURRENCY: int = 4
+    BATCH_LLM_RPM: int = 300  # OpenAI requests per minute across all batch workers
+    BATCH_MAX_RETRIES: int = 3
+    BATCH_CHECKPOINT_DIR: str = "batch_checkpoints"
+    
     # API Settings
     API_TITLE: str = "AI Doctor API"
     API_VERSION: str = "1.0.0"
@@ -23,9 +23,16 @@ class ChatRequest(BaseModel):
             }
         }
 
+class ContextCompression(BaseModel):
+    original_tokens: int = Field(..., description="Estimated tokens of the ranked chunks")
+    compressed_tokens: int = Field(..., description="Estimated tokens sent to the doctor LLM")
+    saved_tokens: int = Field(..., description="original_tokens - compressed_tokens")
+
 class ChatResponse(BaseModel):
     reply: str = Field(..., description="Doctor's response")
     context_used: List[str] = Field(..., description="Medical context retrieved")
+    context_ids: List[str] = Field(default=[], description="Chunk IDs of the context used, in order")
+    context_compression: Optional[ContextCompression] = Field(default=None, description="Context token savings for this request")
     session_id: str = Field(..., description="Session identifier")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
@@ -34,11 +41,32 @@ class ChatResponse(BaseModel):
             "example": {
                 "reply": "Based on your symptoms...",
                 "context_used": ["Flu is associated with fever..."],
+                "context_ids": ["1042"],
+                "context_compression": {"original_tokens": 410, "compressed_tokens": 180, "saved_tokens": 230},
                 "session_id": "user_123",
                 "timestamp": "2025-11-30T10:00:00Z"
             }
         }
 
+class BatchChatItem(BaseModel):
+    id: str = Field(..., description="Stable item identifier (used for checkpoint/resume)")
+    message: str = Field(..., description="User's message/symptoms")
+    session_id: Optional[str] = Field(default=None, description="Session identifier")
+    conversation_history: Optional[List[Message]] = Field(
+        default=[],
+        description="Previous conversation for context"
+    )
+
+class BatchChatResult(BaseModel):
+    id: str = Field(..., description="Item identifier from the request line")
+    status: str = Field(..., description="'ok' or 'error'")
+    reply: Optional[str] = Field(default=None, description="Doctor's response")
+    context_used: List[str] = Field(default=[], description="Medical context retrieved")
+    context_ids: List[str] = Field(default=[], description="Chunk IDs of the context used, in order")
+    context_compression: Optional[ContextCompression] = Field(default=None, description="Context token savings for this item")
+    session_id: Optional[str] = Field(default=None, description="Session identifier")
+    error: Optional[str] = Field(default=None, description="Error message if status is 'error'")
+
 class HealthResponse(BaseModel):
     status: str
     embeddings_loaded: bool
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
 from app.models import HealthResponse
 from app.services.embeddings import embedding_service
+from app.services.admission import admission_controller
+from app.services.context_compressor import context_compressor
 from app.config import settings
 import pandas as pd
 import subprocess
@@ -83,7 +85,7 @@ async def trigger_rebuild_embeddings(background_tasks: BackgroundTasks):
     """
     Manually trigger embedding rebuild
     
-    - Runs prepare_chunks.py and build_embeddings.py
+    - Runs prepare_chunks.py, build_embeddings.py and build_context_cache.py
     - Happens in background
     - Returns immediately
     """
@@ -108,13 +110,20 @@ async def get_embedding_stats():
         - Total documents
         - Collection name
         - Storage path
+        - Ranking path counters (adaptive reranking, context cache hits)
+        - Context compression token totals
     """
     try:
         return {
             "collection_name": settings.COLLECTION_NAME,
+            "shards": settings.SHARDS,
             "storage_path": settings.CHROMA_PERSIST_PATH,
             "total_documents": embedding_service.get_document_count(),
-            "status": "ready" if embedding_service.is_ready() else "not_ready"
+            "status": "ready" if embedding_service.is_ready() else "not_ready",
+            "adaptive_rerank": settings.ADAPTIVE_RERANK,
+            "rank_paths": embedding_service.get_rank_stats(),
+            "context_cache_entries": len(embedding_service.context_cache or []),
+            "context_compression": context_compressor.get_stats()
         }
     except Exception as e:
         raise HTTPException(
@@ -122,6 +131,42 @@ async def get_embedding_stats():
             detail=f"Error getting stats: {str(e)}"
         )
 
+@router.get("/shard-stats")
+async def get_shard_stats():
+    """
+    Get per-shard retrieval statistics
+    
+    Returns:
+        - Shard name and spec (local path or worker URL)
+        - Document count
+        - Query count, errors, last/avg/max latency in ms
+    """
+    try:
+        return {"shards": embedding_service.get_shard_stats()}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting shard stats: {str(e)}"
+        )
+
+@router.get("/admission-stats")
+async def get_admission_stats():
+    """
+    Get admission control statistics (for autoscaling)
+    
+    Returns:
+        - Pending requests (queue depth) and limit
+        - Inference / LLM stage slots in use
+        - Admitted, degraded and rejected request counts
+    """
+    try:
+        return admission_controller.get_stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting admission stats: {str(e)}"
+        )
+
 # Background task function
 def rebuild_embeddings():
     """Rebuild embeddings from scratch"""
@@ -144,6 +189,15 @@ def rebuild_embeddings():
             cwd=os.getcwd()
         )
         
+        # Run build_context_cache.py
+        print("🗂️ Precomputing popular contexts...")
+        subprocess.run(
+            ["python", "scripts/build_context_cache.py"],
+            check=True,
+            cwd=os.getcwd()
+        )
+        embedding_service.reload_context_cache()
+        
         print("✅ Embedding rebuild completed!")
         
     except subprocess.CalledProcessError as e:
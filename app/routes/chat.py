@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from app.models import ChatRequest, ChatResponse, HealthResponse
 from app.services.doctor import doctor_service
 from app.services.embeddings import embedding_service
+from app.services.batch import batch_chat_service, parse_batch_lines
+from app.services.admission import admission_controller, AdmissionRejected
 from app.config import settings
+from typing import Optional
+import asyncio
+import functools
+import json
 
 router = APIRouter(prefix="/api", tags=["Chat"])
 
@@ -14,32 +21,89 @@ async def chat_endpoint(request: ChatRequest):
     - Accepts user message and conversation history
     - Returns doctor's response with medical context
     - Supports follow-up questions through conversation history
+    - Sheds load with 429/503 + Retry-After when the server or session is over its limits
     """
     try:
-        # Convert Pydantic models to dicts for service layer
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in request.conversation_history
-        ]
-        
-        # Get doctor's response
-        reply, context_used = doctor_service.get_response(
-            user_message=request.message,
-            conversation_history=conversation_history
-        )
-        
-        return ChatResponse(
-            reply=reply,
-            context_used=context_used,
-            session_id=request.session_id
+        ticket = admission_controller.admit(request.session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
         )
-        
-    except Exception as e:
+
+    with ticket:
+        try:
+            # Convert Pydantic models to dicts for service layer
+            conversation_history = [
+                {"role": msg.role, "content": msg.content}
+                for msg in request.conversation_history
+            ]
+            
+            # Get doctor's response on the admission executor (one thread per admitted
+            # request, so stage limits don't block the event loop or queue unseen)
+            reply, context_used, context_ids, compression = await asyncio.get_running_loop().run_in_executor(
+                admission_controller.executor,
+                functools.partial(
+                    doctor_service.get_response,
+                    user_message=request.message,
+                    conversation_history=conversation_history,
+                    degraded=ticket.degraded
+                )
+            )
+            
+            return ChatResponse(
+                reply=reply,
+                context_used=context_used,
+                context_ids=context_ids,
+                context_compression=compression,
+                session_id=request.session_id
+            )
+            
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=e.detail,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error processing chat request: {str(e)}"
+            )
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(request: Request, checkpoint_id: Optional[str] = None):
+    """
+    Batch chat endpoint for offline triage and evaluation
+
+    - Accepts JSONL: one {"id", "message", "conversation_history"} object per line
+    - Streams results back as JSONL in completion order
+    - Retrieval and ranking are batched; LLM calls run with bounded concurrency
+    - With checkpoint_id, finished items are saved and replayed on resubmission
+    """
+    try:
+        body = (await request.body()).decode("utf-8")
+        items, errors = parse_batch_lines(body.splitlines())
+        checkpoint = batch_chat_service.open_checkpoint(checkpoint_id) if checkpoint_id else None
+    except ValueError as e:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error processing chat request: {str(e)}"
+            status_code=400,
+            detail=f"Invalid batch request: {str(e)}"
         )
 
+    def stream_results():
+        for record in errors:
+            yield json.dumps(record) + "\n"
+        if checkpoint is not None:
+            for item in items:
+                if checkpoint.is_done(item.id):
+                    yield json.dumps(checkpoint.completed[item.id]) + "\n"
+        for record in batch_chat_service.run(items, checkpoint=checkpoint):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """
@@ -0,0 +1,171 @@
+"""
+Admission control for /api/chat.
+
+- Bounded queue: at most ADMISSION_MAX_PENDING requests are in the system
+  (running or waiting for a stage); beyond that new requests get 503.
+  Admitted requests run on a dedicated executor with one thread per
+  pending slot, so none waits for a worker thread outside the stage limits.
+- Per-stage concurrency: model inference (embedder + reranker) and LLM calls
+  each have their own semaphore; a request that cannot get a slot within
+  ADMISSION_STAGE_TIMEOUT is shed with 503. Batch chat shares the same
+  semaphores but waits for a slot instead of being shed.
+- Per-session rate limiting: token bucket per session_id; excess gets 429.
+- Degraded mode: once ADMISSION_DEGRADE_AT requests are pending, new requests
+  skip query reformulation and cross-encoder reranking.
+
+Every rejection carries a Retry-After value. Counters are exposed via
+GET /api/admin/admission-stats for autoscaling.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+
+
+class AdmissionRejected(Exception):
+    """Request shed by admission control; maps to an HTTP 429/503 with Retry-After."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admitted request. Use as a context manager to release its queue slot."""
+
+    def __init__(self, controller: "AdmissionController", degraded: bool):
+        self.controller = controller
+        self.degraded = degraded
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.controller._release()
+
+
+class AdmissionController:
+    """Bounded queue, per-stage semaphores and per-session rate limits."""
+
+    def __init__(self):
+        self.max_pending = max(1, settings.ADMISSION_MAX_PENDING)
+        self.degrade_at = settings.ADMISSION_DEGRADE_AT
+        self.stage_timeout = settings.ADMISSION_STAGE_TIMEOUT
+        self.retry_after = settings.ADMISSION_RETRY_AFTER
+        self.session_rate = settings.SESSION_RATE_PER_MINUTE / 60.0
+        self.session_burst = max(1, settings.SESSION_BURST)
+
+        self.inference_limit = max(1, settings.INFERENCE_CONCURRENCY)
+        self.llm_limit = max(1, settings.LLM_CONCURRENCY)
+        self._inference = threading.BoundedSemaphore(self.inference_limit)
+        self._llm = threading.BoundedSemaphore(self.llm_limit)
+        # One thread per admitted request (not anyio's shared default limiter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_pending, thread_name_prefix="chat")
+
+        self._lock = threading.Lock()
+        self.pending = 0
+        self._stage_in_use = {"inference": 0, "llm": 0}
+        self._sessions: Dict[str, Tuple[float, float]] = {}  # session_id → (tokens, last refill)
+        self.counters: Dict[str, int] = {
+            "admitted": 0,
+            "degraded": 0,
+            "rejected_queue_full": 0,
+            "rejected_rate_limited": 0,
+            "rejected_stage_timeout": 0,
+        }
+
+    def _take_session_token(self, session_id: str, now: float) -> float:
+        """Consume one token for the session. Returns 0 if allowed, else seconds until a token."""
+        if self.session_rate <= 0:
+            return 0.0
+        tokens, last = self._sessions.get(session_id, (float(self.session_burst), now))
+        tokens = min(float(self.session_burst), tokens + (now - last) * self.session_rate)
+        if tokens < 1.0:
+            self._sessions[session_id] = (tokens, now)
+            return (1.0 - tokens) / self.session_rate
+        self._sessions[session_id] = (tokens - 1.0, now)
+        if len(self._sessions) > 10000:
+            # Forget sessions whose bucket has fully refilled
+            refill_time = self.session_burst / self.session_rate
+            self._sessions = {
+                sid: state for sid, state in self._sessions.items() if now - state[1] < refill_time
+            }
+        return 0.0
+
+    def admit(self, session_id: str) -> AdmissionTicket:
+        """Admit a request or raise AdmissionRejected (429 rate limited, 503 queue full)."""
+        with self._lock:
+            wait = self._take_session_token(session_id, time.monotonic())
+            if wait > 0:
+                self.counters["rejected_rate_limited"] += 1
+                raise AdmissionRejected(
+                    429, "Too many requests for this session", retry_after=max(1, int(wait + 0.999))
+                )
+            if self.pending >= self.max_pending:
+                self.counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(
+                    503, "Server is overloaded, please retry shortly", retry_after=self.retry_after
+                )
+            self.pending += 1
+            degraded = self.degrade_at > 0 and self.pending > self.degrade_at
+            self.counters["admitted"] += 1
+            if degraded:
+                self.counters["degraded"] += 1
+        return AdmissionTicket(self, degraded)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    @contextmanager
+    def _stage(self, name: str, semaphore: threading.BoundedSemaphore, wait: bool) -> Iterator[None]:
+        timeout: Optional[float] = None if wait else self.stage_timeout
+        if not semaphore.acquire(timeout=timeout):
+            with self._lock:
+                self.counters["rejected_stage_timeout"] += 1
+            raise AdmissionRejected(
+                503, f"Server is overloaded ({name} busy), please retry shortly", retry_after=self.retry_after
+            )
+        with self._lock:
+            self._stage_in_use[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage_in_use[name] -= 1
+            semaphore.release()
+
+    def inference_slot(self, wait: bool = False):
+        """
+        Hold a model-inference slot (embedder / reranker) for the duration of the block.
+        wait=True blocks until a slot frees up instead of shedding (batch workloads).
+        """
+        return self._stage("inference", self._inference, wait)
+
+    def llm_slot(self, wait: bool = False):
+        """Hold an LLM-call slot for the duration of the block (wait as in inference_slot)."""
+        return self._stage("llm", self._llm, wait)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Queue depth, stage utilisation and rejection counters."""
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "degrade_at": self.degrade_at,
+                "inference_in_use": self._stage_in_use["inference"],
+                "inference_limit": self.inference_limit,
+                "llm_in_use": self._stage_in_use["llm"],
+                "llm_limit": self.llm_limit,
+                "tracked_sessions": len(self._sessions),
+                **self.counters,
+            }
+
+
+admission_controller = AdmissionController()
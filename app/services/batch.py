@@ -0,0 +1,231 @@
+"""
+Batch chat — offline triage and evaluation over many recorded conversations.
+
+Per batch of BATCH_SIZE items:
+  1. Query reformulation (LLM1) with bounded concurrency.
+  2. Retrieval + ranking batched across items (embeddings.retrieve_and_rank_batch).
+  3. Context compression per item, then Doctor (LLM2) with bounded concurrency.
+
+All OpenAI calls share one rate limiter and retry on rate-limit / transient
+errors. Model inference and LLM calls hold the same admission-control stage
+slots as /api/chat, but wait for them instead of being shed. A running batch
+can therefore push /api/chat into 503 stage timeouts; the slot usage in
+GET /api/admin/admission-stats shows when that happens. Completed items are
+appended to a JSONL checkpoint so a failed run can be resumed without
+redoing finished work.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from openai import APIConnectionError, APITimeoutError, RateLimitError
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models import BatchChatItem, BatchChatResult
+from app.services.doctor import doctor_service
+from app.services.embeddings import RANK_PATH_CACHE, embedding_service
+from app.services.query_reformulator import query_reformulator
+from app.services.context_compressor import context_compressor
+from app.services.admission import admission_controller
+
+T = TypeVar("T")
+
+CHECKPOINT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+class RateLimiter:
+    """Spaces calls evenly so at most `per_minute` start in any minute (thread-safe)."""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_slot - now)
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait:
+            time.sleep(wait)
+
+
+class BatchCheckpoint:
+    """Append-only JSONL of finished results; only 'ok' records count as done."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partial line from an interrupted write
+                    if record.get("status") == "ok" and "id" in record:
+                        self.completed[record["id"]] = record
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def is_done(self, item_id: str) -> bool:
+        return item_id in self.completed
+
+    def write(self, record: dict) -> None:
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+            if record.get("status") == "ok":
+                self.completed[record["id"]] = record
+
+
+def parse_batch_lines(lines: Iterable[str]) -> Tuple[List[BatchChatItem], List[dict]]:
+    """
+    Parse JSONL conversation lines into items. Lines without an "id" get
+    "line-<n>". Invalid lines become error records instead of failing the batch.
+    """
+    items: List[BatchChatItem] = []
+    errors: List[dict] = []
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("each line must be a JSON object")
+            data.setdefault("id", f"line-{n}")
+            data["id"] = str(data["id"])
+            items.append(BatchChatItem(**data))
+        except (json.JSONDecodeError, ValidationError, ValueError) as e:
+            errors.append(
+                BatchChatResult(id=f"line-{n}", status="error", error=f"Invalid line: {e}").model_dump()
+            )
+    return items, errors
+
+
+class BatchChatService:
+    """Runs the conversational RAG pipeline over many conversations."""
+
+    def __init__(self):
+        self.batch_size = max(1, settings.BATCH_SIZE)
+        self.concurrency = max(1, settings.BATCH_LLM_CONCURRENCY)
+        self.max_retries = max(0, settings.BATCH_MAX_RETRIES)
+        self.rate_limiter = RateLimiter(settings.BATCH_LLM_RPM)
+
+    def open_checkpoint(self, checkpoint_id: str) -> BatchCheckpoint:
+        """Open (or create) a named checkpoint under BATCH_CHECKPOINT_DIR."""
+        if not CHECKPOINT_ID_PATTERN.match(checkpoint_id):
+            raise ValueError("checkpoint_id may only contain letters, digits, '-' and '_'")
+        return BatchCheckpoint(os.path.join(settings.BATCH_CHECKPOINT_DIR, f"{checkpoint_id}.jsonl"))
+
+    def _call_llm(self, fn: Callable[[], T]) -> T:
+        """Rate-limited OpenAI call with exponential backoff on transient errors."""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                with admission_controller.llm_slot(wait=True):
+                    return fn()
+            except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                print(f"⚠️ OpenAI call failed ({e.__class__.__name__}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _reformulate(self, item: BatchChatItem, history: List[Dict[str, str]]) -> Tuple[str, Optional[str]]:
+        """Return (search query, error). Errors surviving the retries fail the item."""
+        if not history:
+            # First turn needs no LLM call, so it doesn't use a rate-limit slot
+            return query_reformulator.reformulate(item.message, history), None
+        try:
+            query = self._call_llm(
+                lambda: query_reformulator.reformulate(item.message, history, raise_errors=True)
+            )
+            return query, None
+        except Exception as e:
+            return "", f"Query reformulation failed: {str(e)}"
+
+    def _process_batch(self, items: List[BatchChatItem], pool: ThreadPoolExecutor) -> Iterator[dict]:
+        histories = [
+            [{"role": msg.role, "content": msg.content} for msg in item.conversation_history or []]
+            for item in items
+        ]
+
+        # ——— Step 1: Query reformulation (LLM1), bounded concurrency ———
+        reformulated = list(pool.map(lambda pair: self._reformulate(*pair), zip(items, histories)))
+        for item, (_, error) in zip(items, reformulated):
+            if error:
+                yield BatchChatResult(id=item.id, status="error", session_id=item.session_id, error=error).model_dump()
+        kept = [i for i, (_, error) in enumerate(reformulated) if not error]
+        items = [items[i] for i in kept]
+        histories = [histories[i] for i in kept]
+        queries = [reformulated[i][0] for i in kept]
+        if not items:
+            return
+
+        # ——— Step 2 & 3: Retrieval + Ranking, batched across items ———
+        with admission_controller.inference_slot(wait=True):
+            ranked = embedding_service.retrieve_and_rank_batch(queries, retrieve_n=20, rank_top_k=5)
+
+        # ——— Step 4: Doctor response (LLM2), bounded concurrency ———
+        futures = {}
+        for item, history, query, (context_docs, info) in zip(items, histories, queries, ranked):
+            if info["rank_path"] == RANK_PATH_CACHE:
+                compressed_docs, compression = context_compressor.compress(query, context_docs, use_model=False)
+            else:
+                with admission_controller.inference_slot(wait=True):
+                    compressed_docs, compression = context_compressor.compress(query, context_docs)
+            messages = doctor_service.build_messages(item.message, history, compressed_docs)
+            future = pool.submit(self._call_llm, lambda m=messages: doctor_service.complete(m))
+            futures[future] = (item, context_docs, info.get("ids", []), compression)
+
+        for future in as_completed(futures):
+            item, context_docs, context_ids, compression = futures[future]
+            try:
+                result = BatchChatResult(
+                    id=item.id,
+                    status="ok",
+                    reply=future.result(),
+                    context_used=context_docs,
+                    context_ids=context_ids,
+                    context_compression=compression,
+                    session_id=item.session_id,
+                )
+            except Exception as e:
+                result = BatchChatResult(
+                    id=item.id,
+                    status="error",
+                    session_id=item.session_id,
+                    error=f"Failed to get doctor response: {str(e)}",
+                )
+            yield result.model_dump()
+
+    def run(
+        self,
+        items: List[BatchChatItem],
+        checkpoint: Optional[BatchCheckpoint] = None,
+    ) -> Iterator[dict]:
+        """
+        Process items and yield result records as they finish. Items already
+        completed in `checkpoint` are skipped; new results are appended to it.
+        """
+        pending = [item for item in items if checkpoint is None or not checkpoint.is_done(item.id)]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for start in range(0, len(pending), self.batch_size):
+                for record in self._process_batch(pending[start:start + self.batch_size], pool):
+                    if checkpoint is not None:
+                        checkpoint.write(record)
+                    yield record
+
+
+batch_chat_service = BatchChatService()
@@ -0,0 +1,138 @@
+"""
+Precomputed retrieval contexts.
+
+scripts/build_context_cache.py runs the full retrieve + rerank pipeline for
+every disease name and its common symptom n-grams, and stores the ranked
+top-K chunk IDs in a gzipped JSON table. At startup the table is loaded into
+a read-only lookup that EmbeddingService consults before any model inference.
+
+Queries are matched on a normalized key (lowercase, stopwords dropped,
+tokens sorted), so "Headache and fever" and "fever, headache" share an entry.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+CACHE_FORMAT_VERSION = 2
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by for from has have having i im in is it its "
+    "me my of on or so such symptoms than that the their there these this to very "
+    "was with".split()
+)
+
+
+def normalize_query(query: str) -> str:
+    """Order- and punctuation-insensitive lookup key for a search query."""
+    tokens = {t for t in _TOKEN_PATTERN.findall(query.lower()) if t not in _STOPWORDS}
+    return " ".join(sorted(tokens))
+
+
+def table_fingerprint(chunks_path: str, pipeline: Mapping[str, object]) -> str:
+    """
+    Fingerprint of the chunk table and the pipeline settings that shape the
+    ranked IDs. Chunk IDs are row indices, so a rebuild with the same row
+    count but different rows must still invalidate the table.
+    """
+    digest = hashlib.sha256()
+    if os.path.exists(chunks_path):
+        with open(chunks_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(b"<missing chunk table>")
+    digest.update(json.dumps(dict(pipeline), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ContextCache:
+    """Read-only query → ranked chunks lookup loaded from a precomputed table."""
+
+    def __init__(
+        self,
+        entries: Mapping[str, List[str]],
+        documents: Mapping[str, str],
+        metadatas: Mapping[str, dict],
+        top_k: int,
+    ):
+        self.entries = MappingProxyType(dict(entries))
+        self.documents = MappingProxyType(dict(documents))
+        self.metadatas = MappingProxyType(dict(metadatas))
+        self.top_k = top_k
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, query: str, top_k: int) -> Optional[List[str]]:
+        """Ranked chunk IDs for the query, or None if not precomputed (or fewer than top_k)."""
+        if top_k > self.top_k:
+            return None
+        ids = self.entries.get(normalize_query(query))
+        if ids is None or len(ids) < top_k:
+            return None
+        return ids[:top_k]
+
+    @classmethod
+    def load(cls, path: str, collection, fingerprint: str) -> Optional["ContextCache"]:
+        """
+        Load the table and resolve chunk IDs to documents and metadata once, so
+        lookups need no DB or model access. Returns None if the table is missing
+        or was built against a different chunk table, collection size or
+        pipeline settings (stale after a rebuild).
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                table = json.load(f)
+            if table.get("version") != CACHE_FORMAT_VERSION:
+                print(f"⚠️ Context cache {path} has an unknown format, ignoring it")
+                return None
+            if table.get("fingerprint") != fingerprint or table.get("collection_count") != collection.count():
+                print(f"⚠️ Context cache {path} is stale (chunk table, settings or collection changed), ignoring it")
+                return None
+
+            entries: Dict[str, List[str]] = table["entries"]
+            unique_ids = sorted({chunk_id for ids in entries.values() for chunk_id in ids})
+            documents: Dict[str, str] = {}
+            metadatas: Dict[str, dict] = {}
+            for start in range(0, len(unique_ids), 5000):
+                got = collection.get(ids=unique_ids[start:start + 5000], include=["documents", "metadatas"])
+                documents.update(zip(got["ids"], got["documents"]))
+                metadatas.update((i, meta or {}) for i, meta in zip(got["ids"], got["metadatas"] or []))
+
+            # Drop entries that reference chunks no longer in the collection
+            entries = {
+                key: ids for key, ids in entries.items()
+                if all(chunk_id in documents for chunk_id in ids)
+            }
+            return cls(entries, documents, metadatas, top_k=table["top_k"])
+        except Exception as e:
+            print(f"⚠️ Could not load context cache {path}: {e}")
+            return None
+
+    @staticmethod
+    def save(
+        path: str,
+        entries: Mapping[str, List[str]],
+        top_k: int,
+        collection_count: int,
+        fingerprint: str,
+    ) -> None:
+        """Write a precomputed table (used by scripts/build_context_cache.py)."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        table = {
+            "version": CACHE_FORMAT_VERSION,
+            "top_k": top_k,
+            "collection_count": collection_count,
+            "fingerprint": fingerprint,
+            "entries": dict(entries),
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(table, f, separators=(",", ":"))
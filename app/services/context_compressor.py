@@ -0,0 +1,156 @@
+"""
+Conversational RAG — extractive context compression before LLM2.
+
+Ranked chunks are split into phrases (a chunk that is exactly "<disease> is
+associated with symptoms such as a, b, c." → one phrase per symptom; any
+other text, e.g. guideline or drug notes → one phrase per sentence)
+and scored against the search query with the already-loaded embedding model.
+Every chunk keeps its head and its best phrase, so each retrieved condition
+stays visible; the remaining phrases then fill CONTEXT_TOKEN_BUDGET in score
+order, skipping symptoms that are already in the context.
+
+Precomputed (cached) contexts and degraded requests skip the model and keep
+phrases in their original order, trimmed to the budget only.
+
+Token counts are estimated at ~4 characters per token (no tokenizer needed);
+the per-request savings are returned so the cost / latency win can be measured.
+"""
+
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from app.config import settings
+from app.services.embeddings import embedding_service
+
+# Exactly the prepare_chunks.py template, one sentence; anything else is split by sentence
+_LIST_CHUNK = re.compile(
+    r"^(?P<head>(?:(?![.!?]\s)[^\n])+? is associated with symptoms such as) (?P<items>[^.!?\n]+)\.$"
+)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+class ContextCompressor:
+    """Selects the most query-relevant, non-redundant phrases from ranked chunks."""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "budget_only": 0,
+            "original_tokens": 0,
+            "compressed_tokens": 0,
+        }
+
+    def _split(self, chunk: str) -> Tuple[str, List[str]]:
+        """Return (head, phrases). Head is kept verbatim when any phrase survives."""
+        match = _LIST_CHUNK.match(chunk.strip())
+        if match:
+            items = [item.strip() for item in match.group("items").split(",")]
+            return match.group("head"), [item for item in items if item]
+        return "", [s.strip() for s in _SENTENCE_SPLIT.split(chunk.strip()) if s.strip()]
+
+    def compress(self, query: str, chunks: List[str], use_model: bool = True) -> Tuple[List[str], Dict[str, int]]:
+        """
+        Compress ranked chunks (best first) to fit CONTEXT_TOKEN_BUDGET.
+        use_model=False keeps phrases in their original order instead of scoring
+        them with the embedding model (no inference; cache hits, degraded mode).
+        Returns (compressed chunks in rank order, savings for this request).
+        """
+        original_tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+        use_model = use_model and bool(query.strip())
+        compressed = chunks
+        if settings.CONTEXT_COMPRESSION and chunks:
+            try:
+                compressed = self._compress(query, chunks, use_model)
+            except Exception as e:
+                print(f"❌ Context compression failed, using full chunks: {e}")
+
+        compressed_tokens = sum(estimate_tokens(chunk) for chunk in compressed)
+        savings = {
+            "original_tokens": original_tokens,
+            "compressed_tokens": compressed_tokens,
+            "saved_tokens": original_tokens - compressed_tokens,
+        }
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["budget_only"] += int(not use_model)
+            self.stats["original_tokens"] += original_tokens
+            self.stats["compressed_tokens"] += compressed_tokens
+        return compressed, savings
+
+    def _compress(self, query: str, chunks: List[str], use_model: bool) -> List[str]:
+        heads: List[str] = []
+        units: List[Tuple[int, str]] = []  # (chunk index, phrase), in rank then text order
+        for c, chunk in enumerate(chunks):
+            head, phrases = self._split(chunk)
+            heads.append(head)
+            units.extend((c, phrase) for phrase in phrases)
+        if not units:
+            return chunks
+
+        if use_model:
+            # One encode call for the query and every phrase; normalized → dot product is cosine
+            vectors = embedding_service.model.encode(
+                [query] + [phrase for _, phrase in units], normalize_embeddings=True
+            )
+            scores = vectors[1:] @ vectors[0]
+            order = sorted(range(len(units)), key=lambda u: float(scores[u]), reverse=True)
+        else:
+            order = list(range(len(units)))
+
+        budget = settings.CONTEXT_TOKEN_BUDGET
+        used = 0
+        selected = set()
+        selected_text = set()
+        headed = set()
+
+        def add(u: int) -> None:
+            nonlocal used
+            c, phrase = units[u]
+            used += estimate_tokens(phrase) + 1
+            if c not in headed:
+                used += estimate_tokens(heads[c])
+                headed.add(c)
+            selected.add(u)
+            selected_text.add(phrase.lower())
+
+        # Pass 1: every chunk keeps its head and best phrase, even past the budget
+        best_per_chunk: Dict[int, int] = {}
+        for u in order:
+            best_per_chunk.setdefault(units[u][0], u)
+        for c in sorted(best_per_chunk):
+            add(best_per_chunk[c])
+
+        # Pass 2: fill by score, skipping symptoms already in the context
+        for u in order:
+            if u in selected or units[u][1].lower() in selected_text:
+                continue
+            if used + estimate_tokens(units[u][1]) + 1 <= budget:
+                add(u)
+
+        compressed = []
+        for c, head in enumerate(heads):
+            kept = [phrase for u, (chunk_idx, phrase) in enumerate(units) if chunk_idx == c and u in selected]
+            if not kept:
+                continue
+            if head:
+                compressed.append(f"{head} {', '.join(kept)}.")
+            else:
+                compressed.append(" ".join(kept))
+        return compressed
+
+    def get_stats(self) -> Dict[str, int]:
+        """Totals since startup (tokens estimated)."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["saved_tokens"] = stats["original_tokens"] - stats["compressed_tokens"]
+        return stats
+
+
+context_compressor = ContextCompressor()
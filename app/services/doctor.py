@@ -5,13 +5,17 @@ Orchestration flow:
   1. Query reformulation (LLM1): conversation + current message → one search query.
   2. Retrieval: semantic search for top 20 candidates.
   3. Ranking: re-score and keep top 5 (ranking happens in embeddings.rank_to_top_k).
-  4. Doctor (LLM2): answer using conversation history + top 5 context chunks.
+  4. Compression: keep the most query-relevant, non-redundant phrases within a token budget.
+  5. Doctor (LLM2): answer using conversation history + compressed context.
 """
 
 from openai import OpenAI
 from typing import List, Tuple, Dict
-from app.services.embeddings import embedding_service
+from app.services.embeddings import RANK_PATH_CACHE, embedding_service
 from app.services.query_reformulator import query_reformulator
+from app.services.admission import admission_controller
+from app.services.context_compressor import context_compressor
+from app.config import settings
 import os
 
 # LLM2: defines how the doctor responds (follow-ups, then diagnosis + precautions)
@@ -42,32 +46,83 @@ class DoctorService:
         self,
         user_message: str,
         conversation_history: List[Dict[str, str]],
-    ) -> Tuple[str, List[str]]:
+        degraded: bool = False,
+    ) -> Tuple[str, List[str], List[str], Dict[str, int]]:
         """
         Full conversational RAG pipeline:
 
         1. Reformulate: turn conversation + current message into one search query (LLM1).
         2. Retrieve: get top 20 candidate chunks from the vector DB.
         3. Rank: re-score and keep top 5 (ranking happens in embedding_service).
-        4. Doctor: respond with context (LLM2), asking follow-ups or giving diagnosis.
+        4. Compress: trim the ranked chunks to a token budget (context_compressor).
+        5. Doctor: respond with context (LLM2), asking follow-ups or giving diagnosis.
+
+        Returns (reply, context chunks, context chunk IDs, compression savings).
+        Each stage holds an admission-control slot (model inference or LLM).
+        In degraded mode (server under pressure) steps 1 and 3 are skipped.
         """
         # ——— Step 1: Query reformulation (LLM1) ———
         # So follow-ups like "In my chest" become "chest pain location causes" etc.
-        search_query = query_reformulator.reformulate(
-            user_message=user_message,
-            conversation_history=conversation_history,
-        )
+        if degraded or not conversation_history:
+            search_query = user_message.strip()
+        else:
+            with admission_controller.llm_slot():
+                search_query = query_reformulator.reformulate(
+                    user_message=user_message,
+                    conversation_history=conversation_history,
+                )
 
         # ——— Step 2 & 3: Retrieval (top 20) + Ranking (top 5) ———
-        # Ranking happens inside retrieve_and_rank (see embeddings.rank_to_top_k)
-        context_docs = embedding_service.retrieve_and_rank(
-            query=search_query,
-            retrieve_n=20,
-            rank_top_k=5,
-        )
-        context_text = "\n\n".join(context_docs) if context_docs else "(No specific context retrieved; answer from general knowledge and conversation.)"
+        # Ranking happens inside retrieve_and_rank (see embeddings.rank_adaptive)
+        # Precomputed contexts need no model inference, so they don't take an inference slot
+        cached = embedding_service.cached_result(search_query, top_k=5)
+        if cached is not None:
+            context_docs, retrieval_info = cached
+        else:
+            with admission_controller.inference_slot():
+                context_docs, retrieval_info = embedding_service.retrieve_and_rank_with_info(
+                    query=search_query,
+                    retrieve_n=20,
+                    rank_top_k=5,
+                    use_cache=False,
+                    rerank=not degraded,
+                )
+        if settings.DEBUG:
+            print(
+                f"🔎 Ranking path: {retrieval_info['rank_path']} "
+                f"({retrieval_info['rerank_pairs']} pairs, early_stop={retrieval_info['early_stop']})"
+            )
 
-        # ——— Step 4: Doctor response (LLM2) ———
+        # ——— Step 4: Context compression ———
+        # Cached contexts and degraded requests are trimmed to the budget without the model
+        if degraded or retrieval_info["rank_path"] == RANK_PATH_CACHE:
+            compressed_docs, compression = context_compressor.compress(
+                search_query, context_docs, use_model=False
+            )
+        else:
+            with admission_controller.inference_slot():
+                compressed_docs, compression = context_compressor.compress(search_query, context_docs)
+        if settings.DEBUG:
+            print(f"✂️ Context: {compression['original_tokens']} → {compression['compressed_tokens']} tokens")
+
+        # ——— Step 5: Doctor response (LLM2) ———
+        messages = self.build_messages(user_message, conversation_history, compressed_docs)
+        with admission_controller.llm_slot():
+            try:
+                reply = self.complete(messages)
+                return reply, context_docs, retrieval_info.get("ids", []), compression
+            except Exception as e:
+                print(f"❌ Error getting AI response: {e}")
+                raise Exception(f"Failed to get doctor response: {str(e)}")
+
+    def build_messages(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        context_docs: List[str],
+    ) -> List[Dict[str, str]]:
+        """Build the LLM2 chat messages from history and ranked context chunks."""
+        context_text = "\n\n".join(context_docs) if context_docs else "(No specific context retrieved; answer from general knowledge and conversation.)"
         user_prompt = f"""
 The patient said: "{user_message}"
 
@@ -80,18 +135,16 @@ and after you have enough info, give a possible diagnosis with reasoning and pre
         messages = [{"role": "system", "content": SYSTEM_PROMPT}]
         messages.extend(conversation_history)
         messages.append({"role": "user", "content": user_prompt})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-            )
-            reply = response.choices[0].message.content.strip()
-            return reply, context_docs
-        except Exception as e:
-            print(f"❌ Error getting AI response: {e}")
-            raise Exception(f"Failed to get doctor response: {str(e)}")
+        return messages
+
+    def complete(self, messages: List[Dict[str, str]]) -> str:
+        """Run LLM2 on prepared messages. OpenAI errors propagate to the caller."""
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+        )
+        return response.choices[0].message.content.strip()
 
     def is_healthy(self) -> bool:
         """Check if doctor service can reach OpenAI."""
@@ -5,12 +5,24 @@ Flow:
   1. Semantic search: embed query → retrieve top N candidates (e.g. 20) from vector DB.
   2. Ranking: re-score (query, doc) pairs with a cross-encoder and take top K (e.g. 5).
      → Ranking happens here: improves precision over naive top-K by similarity.
+     Adaptive mode uses the retrieval distances to skip the cross-encoder when
+     dense retrieval is confident, or rerank only the ambiguous band around
+     the top-K boundary, stopping early once the top-K is stable.
+
+Candidates are over-fetched and near-duplicates (same cluster_id) collapsed
+before ranking, so the top K covers more distinct conditions.
+
+Popular queries are answered from a precomputed table (context_cache.py)
+before any of the above runs.
 """
 
+import threading
 import chromadb
 from sentence_transformers import SentenceTransformer, CrossEncoder
-from typing import List
+from typing import List, Tuple, Dict, Any, Optional
 from app.config import settings
+from app.services.context_cache import ContextCache, table_fingerprint
+from app.services.shards import ShardedCollection
 
 
 # How many chunks we fetch from the vector DB (before ranking)
@@ -18,6 +30,16 @@ RETRIEVE_TOP_N = 20
 # How many we keep after ranking (passed to the doctor LLM)
 RANK_TOP_K = 5
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Which ranking path was taken for a query (see rank_adaptive)
+RANK_PATH_DENSE = "dense"  # no reranker available, retrieval order kept
+RANK_PATH_SKIP = "skip"    # dense top-1 is confident, cross-encoder skipped
+RANK_PATH_BAND = "band"    # only the ambiguous middle band was reranked
+RANK_PATH_FULL = "full"    # every candidate was eligible for reranking
+RANK_PATH_CACHE = "cache"  # served from the precomputed context table
+
 
 class EmbeddingService:
     """ChromaDB + embeddings + reranker for context-aware retrieval."""
@@ -26,49 +48,152 @@ class EmbeddingService:
         self.persist_path = settings.CHROMA_PERSIST_PATH
         self.collection_name = settings.COLLECTION_NAME
 
-        # ChromaDB client and collection
-        self.client = chromadb.PersistentClient(path=self.persist_path)
-        try:
-            self.collection = self.client.get_collection(name=self.collection_name)
-            print(f"✅ Loaded collection: {self.collection_name}")
-        except Exception:
-            self.collection = self.client.create_collection(name=self.collection_name)
-            print(f"✅ Created empty collection: {self.collection_name} (add documents via admin/ingest to enable RAG)")
+        # ChromaDB: scatter-gather over shards if configured, else one collection
+        if settings.SHARDS:
+            self.client = None
+            self.collection = ShardedCollection(settings.SHARDS)
+            print(f"✅ Loaded {len(self.collection.shards)} shards: {', '.join(s.spec for s in self.collection.shards)}")
+        else:
+            self.client = chromadb.PersistentClient(path=self.persist_path)
+            try:
+                self.collection = self.client.get_collection(name=self.collection_name)
+                print(f"✅ Loaded collection: {self.collection_name}")
+            except Exception:
+                self.collection = self.client.create_collection(name=self.collection_name)
+                print(f"✅ Created empty collection: {self.collection_name} (add documents via admin/ingest to enable RAG)")
 
         # Embedding model for semantic search
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.model = SentenceTransformer(EMBEDDING_MODEL)
         print("✅ Embedding model loaded")
 
         # Cross-encoder for ranking: (query, document) → relevance score
         # Ranking happens here — re-scores candidates for better precision than similarity-only
         try:
-            self.reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+            self.reranker = CrossEncoder(RERANKER_MODEL)
             print("✅ Reranker (cross-encoder) loaded")
         except Exception as e:
             print(f"⚠️ Reranker not loaded ({e}), ranking will use retrieval order only")
             self.reranker = None
 
-    def retrieve_candidates(self, query: str, n_results: int = RETRIEVE_TOP_N) -> List[str]:
+        # Counters for which ranking path queries take (exposed via admin stats)
+        self._stats_lock = threading.Lock()
+        self.rank_stats: Dict[str, int] = {
+            RANK_PATH_DENSE: 0,
+            RANK_PATH_SKIP: 0,
+            RANK_PATH_BAND: 0,
+            RANK_PATH_FULL: 0,
+            RANK_PATH_CACHE: 0,
+            "early_stops": 0,
+            "pairs_scored": 0,
+            "pairs_candidates": 0,
+            "duplicates_collapsed": 0,
+        }
+
+        # Precomputed contexts for popular queries (scripts/build_context_cache.py)
+        self.context_cache: Optional[ContextCache] = None
+        self.reload_context_cache()
+
+    def _collapse_duplicates(
+        self,
+        ids: List[str],
+        documents: List[str],
+        distances: List[float],
+        metadatas: List[Dict[str, Any]],
+        n_results: int,
+    ) -> Tuple[List[str], List[str], List[float], List[Dict[str, Any]]]:
         """
-        Step 1 — Semantic search: get top N candidate chunks from the vector DB.
-        Does not apply ranking yet.
+        Keep only the closest candidate per near-duplicate cluster (metadata
+        cluster_id from prepare_chunks.py, or identical text for older stores),
+        then the first n_results of what remains.
         """
-        if not query.strip():
-            return []
-        try:
-            count = self.collection.count()
-            if count == 0:
-                return []
-            query_embedding = self.model.encode([query]).tolist()
-            results = self.collection.query(
-                query_embeddings=query_embedding,
-                n_results=min(n_results, count),
+        seen = set()
+        keep: List[int] = []
+        examined = 0
+        for i, doc in enumerate(documents):
+            if len(keep) == n_results:
+                break
+            examined += 1
+            meta = metadatas[i] if i < len(metadatas) else {}
+            key = meta.get("cluster_id") or doc
+            if key in seen:
+                continue
+            seen.add(key)
+            keep.append(i)
+        # Only candidates actually skipped count; the unused over-fetched tail does not
+        with self._stats_lock:
+            self.rank_stats["duplicates_collapsed"] += examined - len(keep)
+        return (
+            [ids[i] for i in keep],
+            [documents[i] for i in keep],
+            [distances[i] for i in keep] if len(distances) == len(documents) else distances[:len(keep)],
+            [metadatas[i] for i in keep],
+        )
+
+    def _search(
+        self, queries: List[str], n_results: int
+    ) -> List[Tuple[List[str], List[str], List[float], List[Dict[str, Any]]]]:
+        """
+        Encode queries in one pass and run a single multi-query search.
+        With DEDUP_CANDIDATES, over-fetches and collapses near-duplicates so
+        up to n_results diverse candidates remain.
+        Returns (ids, documents, distances, metadatas) per query, in order.
+        """
+        results: List[Tuple[List[str], List[str], List[float], List[Dict[str, Any]]]] = [
+            ([], [], [], []) for _ in queries
+        ]
+        active = [i for i, q in enumerate(queries) if q.strip()]
+        if not active:
+            return results
+        fetch_n = n_results * max(1, settings.DEDUP_OVERFETCH) if settings.DEDUP_CANDIDATES else n_results
+        if not isinstance(self.collection, ShardedCollection):
+            # Local collection: clamp to its size (cheap). Shards clamp themselves, so the
+            # sharded path skips a count round-trip to every shard before each query.
+            fetch_n = min(fetch_n, self.collection.count())
+            if fetch_n == 0:
+                return results
+        query_embeddings = self.model.encode([queries[i] for i in active]).tolist()
+        response = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=fetch_n,
+        )
+        ids = response.get("ids") or []
+        documents = response.get("documents") or []
+        distances = response.get("distances") or []
+        metadatas = response.get("metadatas") or []
+        for pos, i in enumerate(active):
+            docs = (documents[pos] if pos < len(documents) else None) or []
+            metas = (metadatas[pos] if pos < len(metadatas) else None) or [None] * len(docs)
+            results[i] = (
+                ids[pos] if pos < len(ids) else [],
+                docs,
+                [float(d) for d in (distances[pos] if pos < len(distances) else None) or []],
+                [meta or {} for meta in metas],
             )
-            documents = results.get("documents", [[]])[0]
-            return documents if documents else []
+            if settings.DEDUP_CANDIDATES:
+                results[i] = self._collapse_duplicates(*results[i], n_results=n_results)
+        return results
+
+    def retrieve_candidates_with_distances(
+        self, query: str, n_results: int = RETRIEVE_TOP_N
+    ) -> Tuple[List[str], List[float]]:
+        """
+        Step 1 — Semantic search: get top N candidate chunks and their distances
+        (ascending, lower is closer). Does not apply ranking yet.
+        """
+        try:
+            _, documents, distances, _ = self._search([query], n_results)[0]
+            return documents, distances
         except Exception as e:
             print(f"❌ Error retrieving context: {e}")
-            return []
+            return [], []
+
+    def retrieve_candidates(self, query: str, n_results: int = RETRIEVE_TOP_N) -> List[str]:
+        """
+        Step 1 — Semantic search: get top N candidate chunks from the vector DB.
+        Does not apply ranking yet.
+        """
+        documents, _ = self.retrieve_candidates_with_distances(query, n_results=n_results)
+        return documents
 
     def rank_to_top_k(self, query: str, documents: List[str], top_k: int = RANK_TOP_K) -> List[str]:
         """
@@ -91,6 +216,220 @@ class EmbeddingService:
             print(f"❌ Error during ranking: {e}, using retrieval order")
             return documents[:top_k]
 
+    def _rerank_incremental(
+        self, query: str, documents: List[str], keep: int, early_stop: bool = True
+    ) -> Tuple[List[Tuple[float, int]], int, bool]:
+        """
+        Score documents with the cross-encoder in small batches (in retrieval
+        order) and stop once the top `keep` set has not changed for
+        RERANK_PATIENCE consecutive batches. With early_stop=False all
+        documents are scored in one call.
+
+        Returns ((score, index) of the top `keep` documents, pairs scored, stopped early).
+        """
+        batch_size = max(1, settings.RERANK_BATCH_SIZE) if early_stop else max(1, len(documents))
+        patience = max(1, settings.RERANK_PATIENCE)
+        scored: List[Tuple[float, int]] = []
+        previous_top = None
+        stable = 0
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            scores = self.reranker.predict([[query, doc] for doc in batch])
+            scored.extend((float(score), start + j) for j, score in enumerate(scores))
+            scored.sort(key=lambda x: x[0], reverse=True)
+            if len(scored) < keep:
+                continue
+            current_top = {idx for _, idx in scored[:keep]}
+            stable = stable + 1 if current_top == previous_top else 0
+            previous_top = current_top
+            remaining = len(documents) - len(scored)
+            if stable >= patience and remaining > 0:
+                return scored[:keep], len(scored), True
+        return scored[:keep], len(scored), False
+
+    def _plan_rank(
+        self, distances: List[float], n_docs: int, top_k: int
+    ) -> Tuple[str, List[int], List[int]]:
+        """
+        Decide the ranking path from retrieval distances.
+
+        Returns (path, locked, band): `locked` candidates keep their retrieval
+        position at the head of the top K, `band` candidates are reranked for
+        the remaining slots. Everything else is dropped.
+        """
+        if len(distances) != n_docs:
+            return RANK_PATH_FULL, [], list(range(n_docs))
+        if n_docs > 1 and distances[1] - distances[0] >= settings.RERANK_SKIP_GAP:
+            return RANK_PATH_SKIP, list(range(min(top_k, n_docs))), []
+
+        boundary = distances[min(top_k, n_docs) - 1]
+        margin = settings.RERANK_BAND_MARGIN
+        locked = [i for i, d in enumerate(distances) if d < boundary - margin]
+        band = [i for i, d in enumerate(distances) if boundary - margin <= d <= boundary + margin]
+        path = RANK_PATH_FULL if len(band) == n_docs else RANK_PATH_BAND
+        return path, locked, band
+
+    def _rank_indices(
+        self,
+        query: str,
+        documents: List[str],
+        distances: List[float],
+        top_k: int,
+        adaptive: bool,
+        rerank: bool = True,
+    ) -> Tuple[List[int], Dict[str, Any]]:
+        """
+        Rank candidates and return (indices of the top K candidates, info).
+        info["scores"] holds the cross-encoder score per returned candidate
+        (None where the candidate kept its retrieval position unscored).
+        """
+        retrieval_order = list(range(min(top_k, len(documents))))
+        info: Dict[str, Any] = {
+            "rank_path": RANK_PATH_DENSE,
+            "rerank_pairs": 0,
+            "early_stop": False,
+            "scores": [None] * len(retrieval_order),
+        }
+        if not documents or not query.strip() or self.reranker is None or not rerank:
+            return retrieval_order, info
+        if adaptive:
+            info["rank_path"], locked, band = self._plan_rank(distances, len(documents), top_k)
+        else:
+            info["rank_path"], locked, band = RANK_PATH_FULL, [], list(range(len(documents)))
+        if info["rank_path"] == RANK_PATH_SKIP:
+            return retrieval_order, info
+
+        try:
+            ranked, pairs, early = self._rerank_incremental(
+                query, [documents[i] for i in band], keep=top_k - len(locked), early_stop=adaptive
+            )
+        except Exception as e:
+            print(f"❌ Error during ranking: {e}, using retrieval order")
+            info["rank_path"] = RANK_PATH_DENSE
+            return retrieval_order, info
+        info["rerank_pairs"] = pairs
+        info["early_stop"] = early
+        info["scores"] = [None] * len(locked) + [score for score, _ in ranked]
+        return locked + [band[i] for _, i in ranked], info
+
+    def rank_adaptive(
+        self,
+        query: str,
+        documents: List[str],
+        distances: List[float],
+        top_k: int = RANK_TOP_K,
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Step 2 (adaptive) — choose how much cross-encoder work a query needs:
+
+        - skip: the dense top-1 leads the runner-up by RERANK_SKIP_GAP → keep retrieval order.
+        - band: candidates clearly inside the top-K keep their place, candidates clearly
+          outside are dropped, and only those within RERANK_BAND_MARGIN of the
+          K-th distance are reranked for the remaining slots.
+        - full: every candidate is in the ambiguous band.
+
+        Returns (top K documents, info) where info records the path taken.
+        """
+        order, info = self._rank_indices(query, documents, distances, top_k, adaptive=True)
+        return [documents[i] for i in order], info
+
+    def _record_rank(self, info: Dict[str, Any], candidates: int) -> None:
+        with self._stats_lock:
+            self.rank_stats[info["rank_path"]] += 1
+            self.rank_stats["pairs_scored"] += info["rerank_pairs"]
+            self.rank_stats["pairs_candidates"] += candidates
+            if info["early_stop"]:
+                self.rank_stats["early_stops"] += 1
+
+    def get_rank_stats(self) -> Dict[str, int]:
+        """Snapshot of ranking path counters since startup."""
+        with self._stats_lock:
+            return dict(self.rank_stats)
+
+    def cached_result(self, query: str, top_k: int) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """Precomputed (documents, info) for popular queries, skipping all model inference."""
+        if self.context_cache is None:
+            return None
+        ids = self.context_cache.lookup(query, top_k)
+        if ids is None:
+            return None
+        with self._stats_lock:
+            self.rank_stats[RANK_PATH_CACHE] += 1
+        info = {
+            "rank_path": RANK_PATH_CACHE,
+            "rerank_pairs": 0,
+            "early_stop": False,
+            "distances": [],
+            "result_distances": None,
+            "ids": list(ids),
+            "scores": [None] * len(ids),
+            "metadatas": [self.context_cache.metadatas.get(i, {}) for i in ids],
+        }
+        return [self.context_cache.documents[i] for i in ids], info
+
+    def context_cache_fingerprint(self) -> str:
+        """Fingerprint of the chunk table and the settings the precomputed table depends on."""
+        return table_fingerprint(settings.CHUNKS_PATH, {
+            "embedding_model": EMBEDDING_MODEL,
+            "reranker_model": RERANKER_MODEL if self.reranker is not None else None,
+            "dedup_candidates": settings.DEDUP_CANDIDATES,
+            "dedup_overfetch": settings.DEDUP_OVERFETCH,
+            "retrieve_top_n": RETRIEVE_TOP_N,
+            # Shard names (not spec order) determine the namespaced IDs
+            "shards": (
+                sorted(shard.name for shard in self.collection.shards)
+                if isinstance(self.collection, ShardedCollection) else []
+            ),
+        })
+
+    def reload_context_cache(self) -> None:
+        """(Re)load the precomputed context table, e.g. after an embedding rebuild."""
+        if not settings.CONTEXT_CACHE_ENABLED:
+            self.context_cache = None
+            return
+        self.context_cache = ContextCache.load(
+            settings.CONTEXT_CACHE_PATH, self.collection, self.context_cache_fingerprint()
+        )
+        if self.context_cache is not None:
+            print(f"✅ Context cache loaded: {len(self.context_cache)} precomputed queries")
+
+    def retrieve_and_rank_with_info(
+        self,
+        query: str,
+        retrieve_n: int = RETRIEVE_TOP_N,
+        rank_top_k: int = RANK_TOP_K,
+        use_cache: bool = True,
+        rerank: bool = True,
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Full pipeline, also returning per-result chunk IDs, retrieval distances
+        (result_distances, aligned with ids), cross-encoder scores and metadata,
+        plus all candidate distances in retrieval order and the ranking path taken.
+
+        Precomputed contexts are served first when use_cache is set; otherwise
+        rank_adaptive is used when ADAPTIVE_RERANK is enabled.
+        rerank=False keeps retrieval order (degraded mode under load).
+        """
+        if use_cache:
+            cached = self.cached_result(query, rank_top_k)
+            if cached is not None:
+                return cached
+        try:
+            ids, candidates, distances, metadatas = self._search([query], retrieve_n)[0]
+        except Exception as e:
+            print(f"❌ Error retrieving context: {e}")
+            ids, candidates, distances, metadatas = [], [], [], []
+        order, info = self._rank_indices(
+            query, candidates, distances, rank_top_k, adaptive=settings.ADAPTIVE_RERANK, rerank=rerank
+        )
+        info["distances"] = distances
+        info["result_distances"] = [distances[i] for i in order]
+        info["ids"] = [ids[i] for i in order]
+        info["metadatas"] = [metadatas[i] for i in order]
+        if candidates:
+            self._record_rank(info, len(candidates))
+        return [candidates[i] for i in order], info
+
     def retrieve_and_rank(
         self,
         query: str,
@@ -101,8 +440,79 @@ class EmbeddingService:
         Full pipeline: retrieve top N candidates, then rank to top K.
         Use this for conversational RAG: pass the reformulated query here.
         """
-        candidates = self.retrieve_candidates(query, n_results=retrieve_n)
-        return self.rank_to_top_k(query, candidates, top_k=rank_top_k)
+        docs, _ = self.retrieve_and_rank_with_info(query, retrieve_n=retrieve_n, rank_top_k=rank_top_k)
+        return docs
+
+    def retrieve_and_rank_batch(
+        self,
+        queries: List[str],
+        retrieve_n: int = RETRIEVE_TOP_N,
+        rank_top_k: int = RANK_TOP_K,
+        use_cache: bool = True,
+    ) -> List[Tuple[List[str], Dict[str, Any]]]:
+        """
+        Batched full pipeline for offline workloads. Retrieval runs as one
+        multi-query search and all (query, doc) pairs that need reranking are
+        scored in a single cross-encoder call. Paths are planned per query as
+        in rank_adaptive, without early stopping (batching makes it moot).
+        """
+        results: List[Optional[Tuple[List[str], Dict[str, Any]]]] = [
+            self.cached_result(q, rank_top_k) if use_cache else None for q in queries
+        ]
+        misses = [i for i, r in enumerate(results) if r is None]
+        try:
+            candidates = self._search([queries[i] for i in misses], retrieve_n)
+        except Exception as e:
+            print(f"❌ Error retrieving batch context: {e}")
+            candidates = [([], [], [], []) for _ in misses]
+
+        plans = []
+        pairs: List[List[str]] = []
+        for i, (_, docs, distances, _) in zip(misses, candidates):
+            query = queries[i]
+            if not docs or not query.strip() or self.reranker is None:
+                plans.append((RANK_PATH_DENSE, list(range(min(rank_top_k, len(docs)))), [], 0))
+                continue
+            if settings.ADAPTIVE_RERANK:
+                path, locked, band = self._plan_rank(distances, len(docs), rank_top_k)
+            else:
+                path, locked, band = RANK_PATH_FULL, [], list(range(len(docs)))
+            plans.append((path, locked, band, len(pairs)))
+            pairs.extend([query, docs[j]] for j in band)
+
+        scores: List[float] = []
+        if pairs:
+            try:
+                scores = [float(s) for s in self.reranker.predict(pairs)]
+            except Exception as e:
+                print(f"❌ Error during batch ranking: {e}, using retrieval order")
+
+        for i, (ids, docs, distances, metadatas), (path, locked, band, offset) in zip(misses, candidates, plans):
+            if band and scores:
+                band_scores = scores[offset:offset + len(band)]
+                ranked = sorted(zip(band_scores, band), key=lambda x: x[0], reverse=True)
+                ranked = ranked[:rank_top_k - len(locked)]
+                order = locked + [j for _, j in ranked]
+                result_scores = [None] * len(locked) + [score for score, _ in ranked]
+            else:
+                order = list(range(min(rank_top_k, len(docs))))
+                result_scores = [None] * len(order)
+                if band:
+                    path = RANK_PATH_DENSE  # reranker failed, nothing was reranked
+            info = {
+                "rank_path": path,
+                "rerank_pairs": len(band) if scores else 0,
+                "early_stop": False,
+                "distances": distances,
+                "result_distances": [distances[j] for j in order],
+                "ids": [ids[j] for j in order],
+                "scores": result_scores,
+                "metadatas": [metadatas[j] for j in order],
+            }
+            if docs:
+                self._record_rank(info, len(docs))
+            results[i] = ([docs[j] for j in order], info)
+        return results
 
     def search_context(self, query: str, n_results: int = 5) -> List[str]:
         """
@@ -119,6 +529,12 @@ class EmbeddingService:
             print(f"❌ Error getting document count: {e}")
             return 0
 
+    def get_shard_stats(self) -> List[Dict[str, Any]]:
+        """Per-shard latency and error counts (empty when not sharded)."""
+        if isinstance(self.collection, ShardedCollection):
+            return self.collection.get_shard_stats()
+        return []
+
     def is_ready(self) -> bool:
         """True if collection exists and has at least one document."""
         return self.collection is not None and self.collection.count() > 0
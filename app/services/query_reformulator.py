@@ -27,6 +27,7 @@ class QueryReformulator:
         self,
         user_message: str,
         conversation_history: List[Dict[str, str]],
+        raise_errors: bool = False,
     ) -> str:
         """
         Build a context-aware search query from the full conversation.
@@ -34,6 +35,8 @@ class QueryReformulator:
         - If no history, the query is just the current message (cleaned).
         - If there is history, LLM1 sees doctor + user turns and outputs
           one optimized query (e.g. "chest pain sharp worse breathing").
+        - On LLM errors the raw message is used, unless raise_errors is set
+          (the batch path retries rate limits itself).
         """
         if not conversation_history and not user_message.strip():
             return ""
@@ -64,6 +67,8 @@ class QueryReformulator:
             query = (response.choices[0].message.content or "").strip()
             return query if query else user_message.strip()
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"❌ Query reformulation failed, using raw message: {e}")
             return user_message.strip()
 
@@ -0,0 +1,223 @@
+"""
+Sharded retrieval — scatter-gather over several ChromaDB collections.
+
+Each shard is either a local persistent collection or an out-of-process shard
+worker (app/shard_worker.py) reached over HTTP. ShardedCollection exposes the
+subset of the Chroma Collection API that EmbeddingService and ContextCache use
+(count / query / get), so it is a drop-in replacement for a single collection:
+
+  - query: every shard is queried concurrently in a thread pool, then the
+    results are merged into the global top N by distance.
+  - IDs are namespaced as "<shard>/<id>" when there is more than one shard,
+    so chunks from different shards never collide. Shard names come from the
+    spec (not its position in SHARDS), so reordering the setting keeps IDs
+    and precomputed contexts valid.
+  - Per-shard latency and errors are tracked; slow shards are logged and
+    reported via GET /api/admin/shard-stats. A failing shard is skipped
+    (partial results) rather than failing the request.
+
+Shard specs (settings.SHARDS), optionally prefixed with "name=":
+  "http://host:port"            → remote shard worker (name: host:port)
+  "persist_path"                → local collection COLLECTION_NAME at persist_path
+                                  (name: last path component)
+  "persist_path@collection"     → local collection with an explicit name
+A local shard whose collection does not exist fails at startup.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import chromadb
+import httpx
+
+from app.config import settings
+
+_QUERY_KEYS = ("ids", "documents", "distances", "metadatas")
+
+
+class LocalShard:
+    """A ChromaDB collection in this process."""
+
+    def __init__(self, name: str, persist_path: str, collection_name: str):
+        self.name = name
+        self.spec = f"{persist_path}@{collection_name}"
+        self.client = chromadb.PersistentClient(path=persist_path)
+        try:
+            self.collection = self.client.get_collection(name=collection_name)
+        except Exception as e:
+            raise ValueError(f"Shard collection {self.spec} not found: {e}") from e
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, query_embeddings: List[List[float]], n_results: int) -> Dict[str, Any]:
+        n = min(n_results, self.collection.count())
+        if n == 0:
+            return {key: [[] for _ in query_embeddings] for key in _QUERY_KEYS}
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n)
+
+    def get(self, ids: List[str], include: List[str]) -> Dict[str, Any]:
+        return self.collection.get(ids=ids, include=include)
+
+
+class RemoteShard:
+    """A shard served by app/shard_worker.py in another process or node."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.spec = url
+        self.http = httpx.Client(base_url=url, timeout=settings.SHARD_TIMEOUT)
+
+    def count(self) -> int:
+        response = self.http.get("/shard/count")
+        response.raise_for_status()
+        return response.json()["count"]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int) -> Dict[str, Any]:
+        response = self.http.post(
+            "/shard/query", json={"query_embeddings": query_embeddings, "n_results": n_results}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, ids: List[str], include: List[str]) -> Dict[str, Any]:
+        response = self.http.post("/shard/get", json={"ids": ids, "include": include})
+        response.raise_for_status()
+        return response.json()
+
+
+def make_shard(spec: str):
+    """Build a shard from its spec; the name is stable across reorderings of SHARDS."""
+    name = ""
+    if "=" in spec.split("://", 1)[0]:
+        name, _, spec = spec.partition("=")
+    if spec.startswith(("http://", "https://")):
+        return RemoteShard(name or urlparse(spec).netloc, spec)
+    persist_path, _, collection_name = spec.partition("@")
+    default_name = os.path.basename(os.path.normpath(persist_path))
+    return LocalShard(name or default_name, persist_path, collection_name or settings.COLLECTION_NAME)
+
+
+class ShardedCollection:
+    """Scatter-gather over shards with a Collection-like interface."""
+
+    def __init__(self, specs: List[str]):
+        self.shards = [make_shard(spec) for spec in specs]
+        self.by_name = {shard.name: shard for shard in self.shards}
+        if len(self.by_name) != len(self.shards) or any("/" in name or not name for name in self.by_name):
+            raise ValueError(
+                "Shard names must be unique and non-empty without '/'; "
+                "prefix specs with 'name=' to disambiguate"
+            )
+        self.namespaced = len(self.shards) > 1
+        self.pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {
+            shard.name: {"queries": 0, "errors": 0, "last_ms": 0.0, "total_ms": 0.0, "max_ms": 0.0}
+            for shard in self.shards
+        }
+
+    def _timed_query(self, shard, query_embeddings: List[List[float]], n_results: int) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            return shard.query(query_embeddings, n_results)
+        except Exception as e:
+            print(f"❌ Shard {shard.name} ({shard.spec}) query failed: {e}")
+            with self._stats_lock:
+                self.stats[shard.name]["errors"] += 1
+            return None
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._stats_lock:
+                stats = self.stats[shard.name]
+                stats["queries"] += 1
+                stats["last_ms"] = elapsed_ms
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if elapsed_ms > settings.SHARD_SLOW_MS:
+                print(f"🐢 Shard {shard.name} ({shard.spec}) took {elapsed_ms:.0f} ms")
+
+    def _global_id(self, shard, chunk_id: str) -> str:
+        return f"{shard.name}/{chunk_id}" if self.namespaced else chunk_id
+
+    def _safe_count(self, shard) -> Optional[int]:
+        try:
+            return shard.count()
+        except Exception as e:
+            print(f"❌ Shard {shard.name} ({shard.spec}) count failed: {e}")
+            with self._stats_lock:
+                self.stats[shard.name]["errors"] += 1
+            return None
+
+    def count(self) -> int:
+        """Total documents across reachable shards; failing shards are skipped and counted as errors."""
+        return sum(n for n in self.pool.map(self._safe_count, self.shards) if n is not None)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int) -> Dict[str, Any]:
+        """Query all shards concurrently and merge the top n_results per query by distance."""
+        responses = list(self.pool.map(
+            lambda shard: self._timed_query(shard, query_embeddings, n_results), self.shards
+        ))
+        merged: Dict[str, List[list]] = {key: [] for key in _QUERY_KEYS}
+        for q in range(len(query_embeddings)):
+            hits = []
+            for shard, response in zip(self.shards, responses):
+                if not response:
+                    continue
+                ids = response["ids"][q]
+                documents = (response.get("documents") or [None] * len(query_embeddings))[q] or [None] * len(ids)
+                distances = response["distances"][q]
+                metadatas = (response.get("metadatas") or [None] * len(query_embeddings))[q] or [None] * len(ids)
+                for chunk_id, doc, dist, meta in zip(ids, documents, distances, metadatas):
+                    hits.append((dist, self._global_id(shard, chunk_id), doc, meta))
+            hits.sort(key=lambda hit: hit[0])
+            hits = hits[:n_results]
+            merged["distances"].append([hit[0] for hit in hits])
+            merged["ids"].append([hit[1] for hit in hits])
+            merged["documents"].append([hit[2] for hit in hits])
+            merged["metadatas"].append([hit[3] for hit in hits])
+        return merged
+
+    def get(self, ids: List[str], include: List[str]) -> Dict[str, Any]:
+        """Fetch chunks by (namespaced) ID from the shards that own them."""
+        grouped: Dict[str, List[str]] = {}
+        for global_id in ids:
+            if self.namespaced:
+                name, _, chunk_id = global_id.partition("/")
+                if name not in self.by_name:
+                    continue
+            else:
+                name, chunk_id = self.shards[0].name, global_id
+            grouped.setdefault(name, []).append(chunk_id)
+
+        result: Dict[str, list] = {"ids": [], "documents": [], "metadatas": []}
+        for name, shard_ids in grouped.items():
+            shard = self.by_name[name]
+            got = shard.get(shard_ids, include)
+            result["ids"].extend(self._global_id(shard, chunk_id) for chunk_id in got["ids"])
+            result["documents"].extend(got.get("documents") or [None] * len(got["ids"]))
+            result["metadatas"].extend(got.get("metadatas") or [None] * len(got["ids"]))
+        return result
+
+    def get_shard_stats(self) -> List[Dict[str, Any]]:
+        """Per-shard latency, error and document counts."""
+        report = []
+        for shard in self.shards:
+            with self._stats_lock:
+                stats = dict(self.stats[shard.name])
+            documents = self._safe_count(shard)
+            report.append({
+                "name": shard.name,
+                "spec": shard.spec,
+                "documents": documents,
+                "queries": int(stats["queries"]),
+                "errors": int(stats["errors"]),
+                "last_ms": round(stats["last_ms"], 1),
+                "avg_ms": round(stats["total_ms"] / stats["queries"], 1) if stats["queries"] else 0.0,
+                "max_ms": round(stats["max_ms"], 1),
+            })
+        return report
@@ -0,0 +1,54 @@
+"""
+Shard worker — serves one ChromaDB collection over HTTP for sharded retrieval.
+
+Run one per shard (on another core or node), pointing it at the shard's store:
+
+    CHROMA_PERSIST_PATH=chromadb_store_shards/shard_0 \
+        uvicorn app.shard_worker:app --port 8101
+
+then list "http://host:8101" in the API's SHARDS setting. Loads no models:
+the API embeds queries once and sends vectors to every shard.
+"""
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+from typing import List
+from app.config import settings
+from app.services.shards import LocalShard
+
+
+class ShardQueryRequest(BaseModel):
+    query_embeddings: List[List[float]] = Field(..., description="Query vectors")
+    n_results: int = Field(..., ge=1, description="Results per query")
+
+
+class ShardGetRequest(BaseModel):
+    ids: List[str] = Field(..., description="Chunk IDs to fetch")
+    include: List[str] = Field(default=["documents", "metadatas"], description="Fields to return")
+
+
+app = FastAPI(title="AI Doctor Shard Worker", version=settings.API_VERSION)
+
+shard = LocalShard("local", settings.CHROMA_PERSIST_PATH, settings.COLLECTION_NAME)
+print(f"✅ Shard worker serving {shard.spec} ({shard.count()} documents)")
+
+
+@app.get("/shard/count")
+def shard_count():
+    return {"count": shard.count()}
+
+
+@app.post("/shard/query")
+def shard_query(request: ShardQueryRequest):
+    try:
+        return shard.query(request.query_embeddings, request.n_results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Shard query failed: {str(e)}")
+
+
+@app.post("/shard/get")
+def shard_get(request: ShardGetRequest):
+    try:
+        return shard.get(request.ids, request.include)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Shard get failed: {str(e)}")
@@ -0,0 +1,47 @@
+"""
+Batch chat CLI — run the AI Doctor pipeline over a JSONL file of conversations.
+
+Usage:
+    python scripts/batch_chat.py conversations.jsonl results.jsonl
+
+Each input line: {"id": "...", "message": "...", "conversation_history": [...]}
+Results are appended to the output file as they finish. The output file is
+also the checkpoint: rerunning the same command skips items already completed.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.batch import BatchCheckpoint, batch_chat_service, parse_batch_lines  # noqa: E402
+
+parser = argparse.ArgumentParser(description="Run AI Doctor over a JSONL file of conversations")
+parser.add_argument("input", help="Input JSONL of conversations")
+parser.add_argument("output", help="Output JSONL of results (also used as the resume checkpoint)")
+args = parser.parse_args()
+
+with open(args.input, "r", encoding="utf-8") as f:
+    items, errors = parse_batch_lines(f)
+print(f"✅ Loaded {len(items)} conversations from {args.input}")
+if errors:
+    print(f"⚠️ Skipping {len(errors)} invalid lines")
+
+checkpoint = BatchCheckpoint(args.output)
+already_done = sum(1 for item in items if checkpoint.is_done(item.id))
+if already_done:
+    print(f"⏩ Resuming: {already_done} conversations already completed")
+
+ok = failed = 0
+for record in batch_chat_service.run(items, checkpoint=checkpoint):
+    if record["status"] == "ok":
+        ok += 1
+    else:
+        failed += 1
+    if (ok + failed) % 50 == 0:
+        print(f"📝 Processed {ok + failed}/{len(items) - already_done}")
+
+print(f"✅ Done: {ok} succeeded, {failed} failed. Results in {os.path.abspath(args.output)}")
+if failed:
+    print("🔁 Rerun the same command to retry failed conversations")
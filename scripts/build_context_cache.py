@@ -0,0 +1,74 @@
+"""
+Precompute ranked contexts for popular queries.
+
+For every disease in Data/dataset.csv, builds queries from the disease name and
+the n-grams (singles and pairs) of its most common symptoms, runs them through
+the full retrieve + rerank pipeline, and stores the ranked top-K chunk IDs in
+CONTEXT_CACHE_PATH. The API loads this table at startup and serves matching
+queries without any model inference.
+
+Run after build_embeddings.py:
+    python scripts/build_context_cache.py
+"""
+
+import os
+import sys
+from itertools import combinations
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.config import settings  # noqa: E402
+from app.services.context_cache import ContextCache, normalize_query  # noqa: E402
+from app.services.embeddings import RANK_TOP_K, RETRIEVE_TOP_N, embedding_service  # noqa: E402
+
+DATASET_PATH = "Data/dataset.csv"
+DISEASE_COL = "diseases"
+TOP_SYMPTOMS_PER_DISEASE = 5  # n-grams are built from each disease's most frequent symptoms
+MAX_NGRAM = 2
+BATCH_SIZE = 256
+
+# Precompute with the full pipeline: every candidate reranked, no early stopping
+settings.ADAPTIVE_RERANK = False
+
+df = pd.read_csv(DATASET_PATH)
+symptom_cols = [c for c in df.columns if c != DISEASE_COL]
+symptom_freq = df.groupby(DISEASE_COL)[symptom_cols].sum()
+print(f"✅ Loaded {len(symptom_freq)} diseases from {DATASET_PATH}")
+
+# One query per normalized key
+queries = {}
+for disease, freq in symptom_freq.iterrows():
+    queries.setdefault(normalize_query(str(disease)), str(disease))
+    top_symptoms = [s for s in freq.sort_values(ascending=False).index[:TOP_SYMPTOMS_PER_DISEASE] if freq[s] > 0]
+    for n in range(1, MAX_NGRAM + 1):
+        for ngram in combinations(top_symptoms, n):
+            text = " ".join(ngram)
+            queries.setdefault(normalize_query(text), text)
+queries.pop("", None)
+print(f"🧠 Ranking {len(queries)} popular queries... this may take a while")
+
+entries = {}
+keys = list(queries)
+for i in range(0, len(keys), BATCH_SIZE):
+    batch_keys = keys[i:i + BATCH_SIZE]
+    results = embedding_service.retrieve_and_rank_batch(
+        [queries[k] for k in batch_keys],
+        retrieve_n=RETRIEVE_TOP_N,
+        rank_top_k=RANK_TOP_K,
+        use_cache=False,
+    )
+    for key, (_, info) in zip(batch_keys, results):
+        if info["ids"]:
+            entries[key] = info["ids"]
+    print(f"✅ Ranked batch {i // BATCH_SIZE + 1}/{(len(keys) - 1) // BATCH_SIZE + 1}")
+
+ContextCache.save(
+    settings.CONTEXT_CACHE_PATH,
+    entries,
+    top_k=RANK_TOP_K,
+    collection_count=embedding_service.get_document_count(),
+    fingerprint=embedding_service.context_cache_fingerprint(),
+)
+print(f"✅ Saved {len(entries)} precomputed contexts to {os.path.abspath(settings.CONTEXT_CACHE_PATH)}")
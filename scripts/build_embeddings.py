@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 import chromadb
+import json
 import os
+import zlib
 
 CSV_PATH = "Data/chunks.csv"     
 COLLECTION_NAME = "medical_knowledge"
@@ -14,43 +17,94 @@ if "chunk" not in df.columns:
 
 texts = df["chunk"].astype(str).tolist()
 ids = [str(i) for i in df["id"]] if "id" in df.columns else [str(i) for i in range(len(df))]
-metadatas = df.drop(columns=["chunk"], errors="ignore").to_dict(orient="records")
+
+# Chunk metadata stored alongside each embedding (Chroma accepts str/int/float/bool values)
+metadata_cols = [c for c in df.columns if c not in ("chunk", "id")]
+if "source_row" not in metadata_cols:
+    df["source_row"] = range(len(df))
+    metadata_cols.append("source_row")
+metadatas = [
+    {k: v for k, v in record.items() if v is not None and not (isinstance(v, float) and pd.isna(v))}
+    for record in df[metadata_cols].to_dict(orient="records")
+]
 
 print(f"✅ Loaded {len(df)} rows from {CSV_PATH}")
 
 model = SentenceTransformer('all-MiniLM-L6-v2')
 print("🧠 Generating embeddings... this may take a minute")
 
-embeddings = model.encode(texts, show_progress_bar=True).tolist()
-print("✅ Embeddings generated!")
+# Kept as one float32 ndarray; batches below are zero-copy views into it
+embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True).astype(np.float32, copy=False)
+print(f"✅ Embeddings generated! ({embeddings.shape[0]} x {embeddings.shape[1]}, {embeddings.nbytes / 1e6:.0f} MB)")
+
+# Sharding: NUM_SHARDS > 1 splits chunks by a stable hash of their ID; SHARD_BY=source
+# puts each value of the "source" column (e.g. diseases, guidelines, drugs) in its own shard.
+# Each shard gets its own persist path (its own SQLite file) under <PERSIST_PATH>_shards/.
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", "1"))
+SHARD_BY = os.getenv("SHARD_BY", "hash")
 
-os.makedirs(PERSIST_PATH, exist_ok=True)
-chroma_client = chromadb.PersistentClient(path=PERSIST_PATH)
+if SHARD_BY == "source" and "source" in df.columns:
+    shard_names = [f"source_{value}" for value in df["source"].astype(str)]
+elif NUM_SHARDS > 1:
+    shard_names = [f"shard_{zlib.crc32(chunk_id.encode()) % NUM_SHARDS}" for chunk_id in ids]
+else:
+    shard_names = None
 
-collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-print(f"📚 Using Chroma collection: {COLLECTION_NAME}")
+if shard_names is None:
+    shards = {PERSIST_PATH: np.arange(len(texts))}
+else:
+    shard_names = np.array(shard_names)
+    shards = {
+        os.path.join(f"{PERSIST_PATH}_shards", name): np.flatnonzero(shard_names == name)
+        for name in sorted(set(shard_names))
+    }
 
 BATCH_SIZE = 5000
+query = "What are the symptoms of bowel cancer?"
+query_emb = model.encode([query]).tolist()
 
-for i in range(0, len(texts), BATCH_SIZE):
-    batch_ids = ids[i:i+BATCH_SIZE]
-    batch_texts = texts[i:i+BATCH_SIZE]
-    batch_embeddings = embeddings[i:i+BATCH_SIZE]
+for persist_path, rows in shards.items():
+    os.makedirs(persist_path, exist_ok=True)
+    chroma_client = chromadb.PersistentClient(path=persist_path)
 
-    collection.add(
-        ids=batch_ids,
-        documents=batch_texts,
-        embeddings=batch_embeddings,
-        
-    )
-    print(f"✅ Inserted batch {i // BATCH_SIZE + 1}/{(len(texts) - 1) // BATCH_SIZE + 1}")
+    collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+    print(f"📚 Using Chroma collection: {COLLECTION_NAME} at {persist_path} ({len(rows)} chunks)")
 
-query = "What are the symptoms of bowel cancer?"
-query_emb = model.encode([query]).tolist()
+    # One shard covering every row keeps the original array; otherwise copy just this shard's rows
+    shard_embeddings = embeddings if len(rows) == len(texts) else embeddings[rows]
+
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch_rows = rows[i:i+BATCH_SIZE]
+        batch_ids = [ids[r] for r in batch_rows]
+        batch_texts = [texts[r] for r in batch_rows]
+        batch_metadatas = [metadatas[r] for r in batch_rows]
+        batch_embeddings = shard_embeddings[i:i+BATCH_SIZE]
+
+        # chromadb 0.4 only accepts lists, so convert just this batch (never the whole array).
+        # upsert (not add): add silently skips existing IDs, so a rebuild would keep stale text/metadata
+        collection.upsert(
+            ids=batch_ids,
+            documents=batch_texts,
+            embeddings=batch_embeddings.tolist(),
+            metadatas=batch_metadatas,
+        )
+        print(f"✅ Upserted batch {i // BATCH_SIZE + 1}/{(len(rows) - 1) // BATCH_SIZE + 1}")
+
+    # Drop chunks left over from a previous build (the running API keeps its collection handle)
+    shard_ids = {ids[r] for r in rows}
+    stale_ids = [chunk_id for chunk_id in collection.get(include=[])["ids"] if chunk_id not in shard_ids]
+    for i in range(0, len(stale_ids), BATCH_SIZE):
+        collection.delete(ids=stale_ids[i:i+BATCH_SIZE])
+    if stale_ids:
+        print(f"🧹 Removed {len(stale_ids)} stale chunks")
+
+    results = collection.query(query_embeddings=query_emb, n_results=min(3, collection.count()))
+    print("\n🔍 Sample Query Results:")
+    for i, (chunk_id, doc) in enumerate(zip(results["ids"][0], results["documents"][0])):
+        print(f"{i+1}. [{chunk_id}] {doc[:150]}...\n")
 
-results = collection.query(query_embeddings=query_emb, n_results=3)
-print("\n🔍 Sample Query Results:")
-for i, doc in enumerate(results["documents"][0]):
-    print(f"{i+1}. {doc[:150]}...\n")
+    print(f"✅ Chroma data saved permanently at: {os.path.abspath(persist_path)}")
 
-print(f"✅ Chroma data saved permanently at: {os.path.abspath(PERSIST_PATH)}")
+if shard_names is not None:
+    print("\n🧩 Serve the shards by setting (in .env):")
+    print("SHARDS=" + json.dumps(list(shards)))
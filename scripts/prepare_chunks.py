@@ -6,16 +6,42 @@ disease_col = "diseases"
 
 symptom_cols = [c for c in df.columns if c != disease_col]
 
-# Build text chunks
+# Rows of the same disease whose symptom sets overlap at least this much (Jaccard)
+# share a cluster ID, so retrieval can collapse near-duplicate chunks before ranking
+CLUSTER_JACCARD = 0.5
+
+# Build text chunks (one per dataset row; the row index is the stable chunk ID)
 chunks = []
+diseases = []
+cluster_ids = []
+cluster_reps = {}  # disease → [(cluster_id, representative symptom set)]
 for _, row in df.iterrows():
     disease = row[disease_col]
     symptoms = [symptom for symptom in symptom_cols if row[symptom] == 1]
     text = f"{disease} is associated with symptoms such as {', '.join(symptoms)}."
     chunks.append(text)
+    diseases.append(disease)
+
+    # Greedy clustering: join the first cluster of this disease that is similar enough
+    symptom_set = frozenset(symptoms)
+    reps = cluster_reps.setdefault(disease, [])
+    for cluster_id, rep in reps:
+        union = len(symptom_set | rep)
+        if union == 0 or len(symptom_set & rep) / union >= CLUSTER_JACCARD:
+            break
+    else:
+        cluster_id = f"{disease}#{len(reps)}"
+        reps.append((cluster_id, symptom_set))
+    cluster_ids.append(cluster_id)
 
-chunk_df = pd.DataFrame({"chunk": chunks})
+chunk_df = pd.DataFrame({
+    "id": range(len(chunks)),
+    "chunk": chunks,
+    "disease": diseases,
+    "source_row": range(len(chunks)),
+    "cluster_id": cluster_ids,
+})
 
 # Save to new file
 chunk_df.to_csv("Data/chunks.csv", index=False)
-print(f"✅ Created {len(chunk_df)} chunks and saved to Data/chunks.csv")
+print(f"✅ Created {len(chunk_df)} chunks ({len(set(cluster_ids))} near-duplicate clusters) and saved to Data/chunks.csv")